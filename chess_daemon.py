@@ -0,0 +1,206 @@
+import os
+import argparse
+import asyncio
+import functools
+import json
+import signal
+
+import chess.engine
+import chess.polyglot
+
+from main import (
+    DEFAULT_DAEMON_SOCKET,
+    analysis_cache_path,
+    board_from_moves,
+    encode_move_tree,
+    generate_move_tree,
+    load_analysis_cache,
+    save_analysis_cache,
+    split_engine_resources,
+    start_engine,
+    start_engines,
+)
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments using argparse and return them.
+    """
+    parser = argparse.ArgumentParser(
+        description="Long-running engine daemon for main.py --engine-daemon. Keeps the engines, "
+                    "their hash tables and the analysis cache alive between runs."
+    )
+
+    parser.add_argument(
+        "--engine-path",
+        type=str,
+        default=None,
+        help="Path to the chess engine. If not provided, uses ENGINE_PATH env var.",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=DEFAULT_DAEMON_SOCKET,
+        help="Unix socket to listen on.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of CPU threads the engine should use."
+    )
+    parser.add_argument(
+        "--hash-size",
+        type=int,
+        default=256,  # MB
+        help="Hash size in MB for the engine's transposition table."
+    )
+    parser.add_argument(
+        "--engines",
+        type=int,
+        default=1,
+        help="Number of engine processes to run in parallel. Threads and hash are split between them."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".analysis_cache",
+        help="Directory where engine analyses are cached between runs."
+    )
+
+    return parser.parse_args()
+
+
+async def handle_request(reader, writer, engines, lock, cache_path, loaded_depths, restart_dead_engines):
+    """
+    Serves one JSON request from a client and replies with the move tree.
+
+    `cache_path(depth)` gives the on-disk analysis cache for an engine depth.
+    It is loaded on the first request at that depth (tracked in
+    `loaded_depths`) and saved after every request. After an engine error,
+    `restart_dead_engines()` replaces any engine process that has exited.
+    """
+    try:
+        request = json.loads(await reader.readline())
+        board = board_from_moves(request.get("moves", []))
+
+        book = None
+        if request.get("book_path"):
+            book = chess.polyglot.open_reader(request["book_path"])
+
+        try:
+            # Requests are served one at a time so they don't compete for engines
+            async with lock:
+                engine_depth = request["engine_depth"]
+                print(f"Analysing {board.fen()} (pgn depth {request['pgn_depth']}, "
+                      f"engine depth {engine_depth})")
+
+                if engine_depth not in loaded_depths:
+                    load_analysis_cache(cache_path(engine_depth))
+                    loaded_depths.add(engine_depth)
+
+                try:
+                    move_tree = await generate_move_tree(
+                        board, engines, request["pgn_depth"], engine_depth,
+                        book=book, book_depth=request.get("book_depth", 0),
+                    )
+                except chess.engine.EngineError:
+                    await restart_dead_engines()
+                    raise
+                finally:
+                    # Keep whatever was analysed, even if the request failed
+                    save_analysis_cache(cache_path(engine_depth), engine_depth)
+        finally:
+            if book is not None:
+                book.close()
+
+        response = {"move_tree": encode_move_tree(move_tree)}
+    except (ValueError, KeyError, TypeError, OSError, chess.engine.EngineError) as e:
+        response = {"error": str(e)}
+
+    try:
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+    except ConnectionError:
+        # The client hung up, e.g. another daemon checking the socket is live
+        pass
+    finally:
+        writer.close()
+
+
+async def serve():
+    """
+    Starts the engines and serves requests until interrupted or terminated.
+    """
+    args = parse_arguments()
+
+    # Determine engine path from argument or environment variable
+    engine_path = args.engine_path or os.getenv("ENGINE_PATH")
+    if not engine_path:
+        print("ERROR: No engine path provided (via --engine-path or ENGINE_PATH env).")
+        exit(1)
+
+    # Only clear a socket left behind by a previous daemon, never a live one
+    if os.path.exists(args.socket):
+        try:
+            _, writer = await asyncio.open_unix_connection(args.socket)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(args.socket)
+        else:
+            writer.close()
+            print(f"ERROR: Another daemon is already listening on '{args.socket}'.")
+            exit(1)
+
+    engines = await start_engines(engine_path, args.engines, args.threads, args.hash_size)
+    threads_per_engine, hash_per_engine = split_engine_resources(args.engines, args.threads, args.hash_size)
+    lock = asyncio.Lock()
+    stop = asyncio.Event()
+
+    async def restart_dead_engines():
+        # A crashed engine would fail every later request, so replace it, or
+        # shut the daemon down if it cannot be replaced
+        for i, engine in enumerate(engines):
+            if not engine.returncode.done():
+                continue
+            print(f"Engine {i + 1} exited with code {engine.returncode.result()}, restarting it.")
+            try:
+                engines[i] = await start_engine(engine_path, threads_per_engine, hash_per_engine)
+            except Exception as e:
+                print(f"Failed to restart engine at {engine_path}: {e}")
+                stop.set()
+                return
+
+    # Hashing the engine binary is slow, so resolve each depth's cache file once
+    cache_path = functools.lru_cache(maxsize=None)(
+        lambda engine_depth: analysis_cache_path(args.cache_dir, engine_path, engine_depth)
+    )
+    loaded_depths = set()
+
+    try:
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: handle_request(
+                reader, writer, engines, lock, cache_path, loaded_depths, restart_dead_engines,
+            ),
+            path=args.socket,
+        )
+        # The daemon runs arbitrary analyses for whoever can connect
+        os.chmod(args.socket, 0o600)
+        print(f"Engine daemon listening on '{args.socket}'")
+
+        # Shut down cleanly (engines quit, socket removed) on Ctrl-C or kill
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        async with server:
+            await stop.wait()
+    finally:
+        for engine in engines:
+            if not engine.returncode.done():
+                await engine.quit()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -1,18 +1,53 @@
 import os
 import argparse
+import asyncio
+import hashlib
+import json
+import pickle
+from collections import Counter, deque
 
 import chess
 import chess.engine
 import chess.pgn
+import chess.polyglot
 from tqdm import tqdm
 
 
+# Named sets of argument defaults selectable with --preset
+PRESETS = {
+    "deep": {
+        "moves": ["d4", "d5", "c4", "e6"],
+        "pgn_depth": 16,
+        "engine_depth": 30,
+        "threads": 18,
+        "hash_size": 65536,  # MB
+    },
+}
+
+# Unix socket the engine daemon (chess_daemon.py) listens on by default
+DEFAULT_DAEMON_SOCKET = "/tmp/chess-daemon.sock"
+
+# Principal variations keyed by (Zobrist hash, engine depth, multipv)
+_analysis_cache: dict[tuple[int, int, int], list] = {}
+
+# A search is stopped early once it reports a mate, or a score beyond
+# EARLY_STOP_CP centipawns, at EARLY_STOP_DEPTH or deeper.
+EARLY_STOP_CP = 500
+EARLY_STOP_DEPTH = 10
+
+
 def parse_arguments():
     """
     Parse command-line arguments using argparse and return them.
     """
     parser = argparse.ArgumentParser(description="Chess Opening Tree Generator")
     
+    parser.add_argument(
+        "--preset",
+        choices=sorted(PRESETS),
+        default=None,
+        help="Use a named set of defaults. Options given explicitly still take precedence.",
+    )
     parser.add_argument(
         "--moves",
         type=str,
@@ -56,192 +91,707 @@ def parse_arguments():
         default=256,  # MB
         help="Hash size in MB for the engine's transposition table."
     )
+    parser.add_argument(
+        "--engines",
+        type=int,
+        default=1,
+        help="Number of engine processes to run in parallel. Threads and hash are split between them."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".analysis_cache",
+        help="Directory where engine analyses are cached between runs."
+    )
+    parser.add_argument(
+        "--book-path",
+        type=str,
+        default=None,
+        help="Polyglot opening book whose moves are used instead of engine analysis where available."
+    )
+    parser.add_argument(
+        "--book-depth",
+        type=int,
+        default=12,
+        help="Only consult the opening book for positions before this many plies."
+    )
+    parser.add_argument(
+        "--engine-daemon",
+        action="store_true",
+        help="Send the request to a running chess_daemon.py instead of starting engines (Unix only). "
+             "Engine options and --cache-dir are set when starting the daemon instead."
+    )
+    parser.add_argument(
+        "--daemon-socket",
+        type=str,
+        default=DEFAULT_DAEMON_SOCKET,
+        help="Unix socket of the engine daemon."
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not show the progress bar."
+    )
+
+    # Presets only replace defaults, so explicit options still override them
+    preset = parser.parse_known_args()[0].preset
+    if preset:
+        parser.set_defaults(**PRESETS[preset])
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    if args.engine_daemon:
+        # The daemon's engines and cache are configured when it starts
+        daemon_options = ["engine_path", "threads", "hash_size", "engines", "cache_dir"]
+        given = [f"--{name.replace('_', '-')}" for name in daemon_options
+                 if getattr(args, name) != parser.get_default(name)]
+        if given:
+            parser.error(f"{', '.join(given)} cannot be used with --engine-daemon; "
+                         f"pass them to chess_daemon.py instead")
+
+    return args
 
 
 def initialize_pgn_headers():
     """
-    Creates and returns a PGN Game object with default headers.
+    Creates and returns the default PGN headers.
+    """
+    headers = chess.pgn.Headers()
+    headers["Event"] = "Chess Analysis"
+    headers["Site"] = "*"
+    headers["Date"] = "*"
+    headers["Round"] = "*"
+    headers["White"] = "User"
+    headers["Black"] = "Engine"
+    headers["Result"] = "*"
+    return headers
+
+
+def analysis_cache_path(cache_dir, engine_path, engine_analysis_depth):
+    """
+    Returns the cache file for this engine binary and analysis depth.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(engine_path, 'rb') as engine_file:
+            for chunk in iter(lambda: engine_file.read(1 << 20), b''):
+                digest.update(chunk)
+    except OSError:
+        # Engine given as a bare command name; fall back to hashing the name
+        digest.update(engine_path.encode())
+
+    return os.path.join(cache_dir, f"{digest.hexdigest()[:16]}-depth{engine_analysis_depth}.pkl")
+
+
+def load_analysis_cache(cache_path):
+    """
+    Loads previously saved analyses into the in-memory cache, if any exist.
+    """
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            _analysis_cache.update(pickle.load(cache_file))
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f"Ignoring unreadable analysis cache '{cache_path}': {e}")
+
+
+def save_analysis_cache(cache_path, engine_analysis_depth):
+    """
+    Writes the cached analyses for one engine depth to disk for future runs.
+    """
+    analyses = {key: pvs for key, pvs in _analysis_cache.items() if key[1] == engine_analysis_depth}
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'wb') as cache_file:
+            pickle.dump(analyses, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"Failed to save analysis cache: {e}")
+
+
+def multipv_schedule(pgn_depth, starting_turn):
+    """
+    Returns how many moves to request at each ply of the tree.
+
+    White uses multipv=1, Black uses multipv=3. All positions of a ply have
+    the same side to move, so this is decided once per ply up front instead
+    of for every node.
     """
-    game = chess.pgn.Game()
-    game.headers["Event"] = "Chess Analysis"
-    game.headers["Site"] = "*"
-    game.headers["Date"] = "*"
-    game.headers["Round"] = "*"
-    game.headers["White"] = "User"
-    game.headers["Black"] = "Engine"
-    game.headers["Result"] = "*"
-    return game
+    schedule = []
+    turn = starting_turn
+    for _ in range(pgn_depth):
+        schedule.append(1 if turn == chess.WHITE else 3)
+        turn = not turn
+
+    return schedule
 
 
 def estimate_total_moves(pgn_depth, starting_turn):
     """
     Estimate the total number of moves to process for the progress bar.
     
-    White uses multipv=1, Black uses multipv=3.
+    Every ply multiplies the number of positions by its multipv, so the
+    total is summed ply by ply.
     """
-    def count_nodes(depth, turn):
-        if depth == 0:
-            return 0
-        moves = 1 if turn == chess.WHITE else 3
-        nodes = moves
-        for _ in range(moves):
-            nodes += count_nodes(depth - 1, not turn)
-        return nodes
+    total = 0
+    frontier = 1
+    for multipv in multipv_schedule(pgn_depth, starting_turn):
+        frontier *= multipv
+        total += frontier
 
-    return count_nodes(pgn_depth, starting_turn)
+    return total
 
 
-def generate_move_tree(position, engine, pgn_depth, engine_analysis_depth, progress_bar=None):
+class IncrementalZobrist:
     """
-    Recursively build a move tree (as a nested list structure) for PGN export.
-    White uses multipv=1, Black uses multipv=3.
+    Keeps the polyglot Zobrist hash of a board up to date across push/pop.
+
+    Only the keys a move actually changes (moved, captured and castling rook
+    pieces, castling rights, en passant file and side to move) are XORed in,
+    instead of rehashing all 64 squares as chess.polyglot.zobrist_hash does.
     """
-    if pgn_depth == 0:
-        return []
 
-    move_tree = []
-    multipv = 1 if position.turn == chess.WHITE else 3
+    _hasher = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+    def __init__(self, board=None):
+        self.hash = chess.polyglot.zobrist_hash(board) if board is not None else 0
+        self._history = []
+
+    def copy(self):
+        """
+        Returns a tracker with the same hash and an empty history.
+        """
+        other = IncrementalZobrist()
+        other.hash = self.hash
+        return other
+
+    def push(self, board, move):
+        """
+        Plays `move` on `board` and updates the hash to match.
+        """
+        self._history.append(self.hash)
+
+        if board.chess960:
+            # Castling moves are ambiguous to decode here; rehash instead
+            board.push(move)
+            self.hash = chess.polyglot.zobrist_hash(board)
+            return
+
+        self.hash ^= self._piece_keys(board, move) ^ self._state_keys(board)
+        board.push(move)
+        self.hash ^= self._state_keys(board)
+
+    def pop(self, board):
+        """
+        Takes back the last move on `board` and restores the previous hash.
+        """
+        board.pop()
+        self.hash = self._history.pop()
+
+    @classmethod
+    def _state_keys(cls, board):
+        return (cls._hasher.hash_castling(board) ^ cls._hasher.hash_ep_square(board) ^
+                cls._hasher.hash_turn(board))
+
+    @staticmethod
+    def _piece_key(piece_type, color, square):
+        return chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((piece_type - 1) * 2 + int(color)) + square]
+
+    @classmethod
+    def _piece_keys(cls, board, move):
+        color = board.turn
+        piece_type = board.piece_type_at(move.from_square)
+        keys = cls._piece_key(piece_type, color, move.from_square)
+
+        if board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            if board.is_kingside_castling(move):
+                king_to, rook_from, rook_to = chess.G1, chess.H1, chess.F1
+            else:
+                king_to, rook_from, rook_to = chess.C1, chess.A1, chess.D1
+            keys ^= cls._piece_key(chess.KING, color, king_to + 8 * rank)
+            keys ^= cls._piece_key(chess.ROOK, color, rook_from + 8 * rank)
+            keys ^= cls._piece_key(chess.ROOK, color, rook_to + 8 * rank)
+            return keys
+
+        if board.is_en_passant(move):
+            captured_square = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+            keys ^= cls._piece_key(chess.PAWN, not color, captured_square)
+        else:
+            captured = board.piece_at(move.to_square)
+            if captured:
+                keys ^= cls._piece_key(captured.piece_type, captured.color, move.to_square)
+
+        keys ^= cls._piece_key(move.promotion or piece_type, color, move.to_square)
+        return keys
+
+
+def is_decisive(info):
+    """
+    Returns True if an engine info update already shows a decisive score.
 
-    try:
-        analyses = engine.analyse(position, chess.engine.Limit(depth=engine_analysis_depth), multipv=multipv)
-    except chess.engine.EngineError as e:
-        print(f"Engine error during analysis: {e}")
-        exit(1)
+    Aspiration-window bound lines are ignored: a fail-low upperbound means the
+    PV's first move was just refuted, so its score cannot be trusted.
+    """
+    score = info.get('score')
+    if score is None or info.get('depth', 0) < EARLY_STOP_DEPTH:
+        return False
+    if info.get('upperbound') or info.get('lowerbound'):
+        return False
+
+    score = score.relative
+    return score.is_mate() or abs(score.score()) > EARLY_STOP_CP
+
+
+async def analyse_until_decisive(engine, position, limit, root_moves=None):
+    """
+    Runs a single-PV search like engine.analyse, but stops it as soon as the
+    score is decisive. The PV is then taken from that shallower iteration
+    rather than from the full search depth.
+    """
+    with await engine.analysis(position, limit, root_moves=root_moves,
+                               info=chess.engine.INFO_SCORE | chess.engine.INFO_PV) as analysis:
+        # Merge updates as engine.analyse does, but only up to the stopping point
+        result = {}
+        async for info in analysis:
+            result.update(info)
+            if is_decisive(info):
+                analysis.stop()
+                break
+        await analysis.wait()
+
+    return result
 
-    # Engine might return a single dict instead of a list
-    if not isinstance(analyses, list):
-        analyses = [analyses]
 
-    for analysis in analyses:
+async def analyse_top_moves(engine, position, limit, count):
+    """
+    Find the engine's top `count` moves using single-PV searches.
+
+    Rather than a multipv search, which weakens pruning, the position is
+    searched once, the best move is excluded from the root moves, and the
+    search is repeated until `count` moves have been found.
+    """
+    analyses = []
+    remaining_moves = list(position.legal_moves)
+    root_moves = None
+
+    while remaining_moves and len(analyses) < count:
+        analysis = await analyse_until_decisive(engine, position, limit, root_moves)
         pv = analysis.get('pv')
-        if pv:
-            board_copy = position.copy()
-            legal_pv = []
-            for move in pv:
-                if board_copy.is_legal(move):
-                    legal_pv.append(move)
-                    board_copy.push(move)
-                else:
-                    # If illegal move is found, discard
-                    legal_pv = []
-                    break
-
-            if legal_pv:
-                # First move in the PV
-                move = legal_pv[0]
-                next_position = position.copy()
-                next_position.push(move)
-
-                subsequent_moves = generate_move_tree(
-                    next_position, engine, pgn_depth - 1, engine_analysis_depth, progress_bar
-                )
-                move_tree.append((move, subsequent_moves))
+        if not pv:
+            break
+
+        analyses.append(analysis)
+        remaining_moves = [move for move in remaining_moves if move != pv[0]]
+        root_moves = remaining_moves
+
+    return analyses
+
+
+async def generate_move_tree(position, engines, pgn_depth, engine_analysis_depth, progress_bar=None,
+                             book=None, book_depth=0):
+    """
+    Build a move tree (as a nested list structure) for PGN export.
+    White uses multipv=1, Black uses multipv=3.
+
+    The tree is expanded breadth-first, one ply at a time. Every position of a
+    ply is independent, so their analyses are pipelined concurrently across the
+    pool of engine processes; each engine keeps its transposition table warm
+    for the whole run.
+
+    If a polyglot `book` is given, positions before `book_depth` plies that
+    have book moves take the highest weighted ones instead of being analysed.
 
+    Raises chess.engine.EngineError if an analysis fails.
+    """
+    move_tree = []
+    schedule = multipv_schedule(pgn_depth, position.turn)
+
+    # Entries are (children, position, Zobrist tracker)
+    frontier = deque()
+    if schedule:
+        # Positions are advanced in place below, so leave the caller's board alone
+        root = position.copy(stack=False)
+        frontier.append((move_tree, root, IncrementalZobrist(root)))
+
+    # A UCI engine can only run one search at a time, so each analysis borrows
+    # an idle engine and returns it when done.
+    idle_engines = asyncio.Queue()
+    for engine in engines:
+        idle_engines.put_nowait(engine)
+
+    # How many nodes of the current ply share each cache key
+    node_counts = Counter()
+
+    async def analyse(key, node_position, multipv):
+        engine = await idle_engines.get()
+        try:
+            analyses = await analyse_top_moves(engine, node_position, chess.engine.Limit(depth=engine_analysis_depth), multipv)
+        finally:
+            idle_engines.put_nowait(engine)
+
+        # Only the principal variations are needed, which keeps the cache small
+        _analysis_cache[key] = [analysis.get('pv') for analysis in analyses]
+
+        # Report every node as soon as it is analysed; tqdm's mininterval
+        # keeps the repaints cheap.
         if progress_bar:
-            progress_bar.update(1)
+            progress_bar.update(len(_analysis_cache[key]) * node_counts[key])
+
+    for ply, multipv in enumerate(schedule):
+        if not frontier:
+            break
+        is_last_ply = ply == len(schedule) - 1
+
+        level = list(frontier)
+        frontier.clear()
+
+        # Only analyse positions that are neither cached nor already queued
+        # in this ply (transpositions reached through another move order).
+        keys = []
+        pending = {}
+        book_lines = {}
+        node_counts.clear()
+        for _, node_position, zobrist in level:
+            key = (zobrist.hash, engine_analysis_depth, multipv)
+            keys.append(key)
+            node_counts[key] += 1
+            if key in book_lines or key in pending:
+                continue
+
+            if book is not None and node_position.ply() < book_depth:
+                entries = sorted(book.find_all(node_position, minimum_weight=1),
+                                 key=lambda entry: entry.weight, reverse=True)
+                if entries:
+                    book_lines[key] = [[entry.move] for entry in entries[:multipv]]
+                    continue
+
+            if key not in _analysis_cache:
+                pending[key] = analyse(key, node_position, multipv)
+
+        # Cached and book nodes are done already; analysed ones report themselves
+        if progress_bar:
+            progress_bar.update(sum(len(book_lines.get(key) or _analysis_cache[key])
+                                    for key in keys if key not in pending))
+
+        tasks = [asyncio.create_task(coroutine) for coroutine in pending.values()]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the sibling searches too, so none keep running on engines
+            # the caller may hand to the next request.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        for key, (children, node_position, zobrist) in zip(keys, level):
+            # Generate the legal moves once per node and test PVs by membership
+            legal_moves = set(node_position.legal_moves)
+            for pv in book_lines.get(key) or _analysis_cache[key]:
+                # Only the first move of the PV is used, so only it is validated
+                if pv and pv[0] in legal_moves:
+                    move = pv[0]
+                    subsequent_moves = []
+                    children.append((move, subsequent_moves))
+
+            if not is_last_ply:
+                # This position is not needed once its children exist, so the
+                # last child takes over the board and only its siblings copy it.
+                for i, (move, subsequent_moves) in enumerate(children):
+                    if i == len(children) - 1:
+                        next_position, next_zobrist = node_position, zobrist
+                    else:
+                        next_position, next_zobrist = node_position.copy(stack=False), zobrist.copy()
+                    next_zobrist.push(next_position, move)
+                    frontier.append((subsequent_moves, next_position, next_zobrist))
 
     return move_tree
 
 
-def add_moves_to_pgn(node, move_tree):
+def write_pgn(pgn_file, headers, board, move_tree, columns=80):
     """
-    Recursively adds moves (and their variations) from the move_tree to the PGN node.
+    Writes the headers, the moves that reached `board`, and the move tree (as
+    variations) straight to pgn_file.
+
+    Movetext is produced with SAN from a single board using push/pop, so no
+    chess.pgn.Game node tree is ever built in memory. Finished lines are
+    buffered and written in one call per top-level variation rather than one
+    per token or line. The layout matches chess.pgn.FileExporter.
     """
-    if not move_tree:
-        return
+    chunk = [f"[{tagname} \"{tagvalue}\"]\n" for tagname, tagvalue in headers.items()]
+    chunk.append("\n")
+
+    # The moves played to reach the analysed position form the trunk of the tree
+    for move in reversed(board.move_stack):
+        move_tree = [(move, move_tree)]
+    position = board.root()
+
+    line = ""
+    force_movenumber = True
+    variation_depth = 0
+
+    def write_token(token):
+        nonlocal line
+        if columns - len(line) < len(token):
+            if line:
+                chunk.append(line.rstrip() + "\n")
+            line = ""
+        line += token
+
+    def flush_chunk():
+        pgn_file.write("".join(chunk))
+        chunk.clear()
+
+    def write_move(move):
+        nonlocal force_movenumber
+        if position.turn == chess.WHITE:
+            write_token(f"{position.fullmove_number}. ")
+        elif force_movenumber:
+            write_token(f"{position.fullmove_number}... ")
+        write_token(position.san(move) + " ")
+        force_movenumber = False
+
+    # Walk the tree with an explicit stack of actions, so deep trees cannot
+    # hit Python's recursion limit.
+    stack = [("tree", move_tree)]
+    while stack:
+        action, *operands = stack.pop()
+
+        if action == "tree":
+            tree, = operands
+            if not tree:
+                continue
+
+            # Main line first, then side lines, then the continuation of the main line
+            main_move, main_variations = tree[0]
+            write_move(main_move)
+            stack.append(("pop",))
+            stack.append(("tree", main_variations))
+            stack.append(("push", main_move))
+            for move, variations in reversed(tree[1:]):
+                stack.append(("variation", move, variations))
+
+        elif action == "variation":
+            move, variations = operands
+            write_token("( ")
+            variation_depth += 1
+            force_movenumber = True
+            write_move(move)
+            position.push(move)
+            stack.append(("end_variation",))
+            stack.append(("tree", variations))
+
+        elif action == "end_variation":
+            position.pop()
+            write_token(") ")
+            force_movenumber = True
+
+            variation_depth -= 1
+            if variation_depth == 0:
+                flush_chunk()
+
+        elif action == "push":
+            position.push(*operands)
+
+        elif action == "pop":
+            position.pop()
+
+    write_token(headers["Result"] + " ")
+    if line:
+        chunk.append(line.rstrip() + "\n")
+    chunk.append("\n")
+    flush_chunk()
+
+
+def board_from_moves(moves):
+    """
+    Returns a board with the given SAN moves played from the starting position.
+    Raises ValueError naming the first invalid move.
+    """
+    board = chess.Board()
+    for move_san in moves:
+        try:
+            board.push(board.parse_san(move_san))
+        except ValueError as e:
+            raise ValueError(f"Invalid move '{move_san}': {e}") from e
+    return board
+
+
+def split_engine_resources(num_engines, num_threads, hash_size):
+    """
+    Returns the (threads, hash MB) each engine gets when the totals are split
+    evenly across the pool.
+    """
+    num_engines = max(1, num_engines)
+    return max(1, num_threads // num_engines), max(1, hash_size // num_engines)
 
-    # Main line: the first move in the move_tree
-    main_move, main_variations = move_tree[0]
-    main_node = node.add_main_variation(main_move)
-    add_moves_to_pgn(main_node, main_variations)
 
-    # Any remaining moves are considered variations / side lines
-    for move, variations in move_tree[1:]:
-        variation_node = node.add_variation(move)
-        add_moves_to_pgn(variation_node, variations)
+async def start_engine(engine_path, threads, hash_size):
+    """
+    Starts and configures a single engine process.
+    """
+    _, engine = await chess.engine.popen_uci(engine_path)
+    try:
+        await engine.configure({"Threads": threads, "Hash": hash_size})
+    except BaseException:
+        await engine.quit()
+        raise
+    return engine
 
 
-def main():
+async def start_engines(engine_path, num_engines, num_threads, hash_size):
+    """
+    Starts the pool of engine processes, splitting threads and hash evenly.
+    """
+    num_engines = max(1, num_engines)
+    threads_per_engine, hash_per_engine = split_engine_resources(num_engines, num_threads, hash_size)
+
+    engines = []
+    try:
+        for _ in range(num_engines):
+            engines.append(await start_engine(engine_path, threads_per_engine, hash_per_engine))
+    except Exception as e:
+        print(f"Failed to start engine at {engine_path}: {e}")
+        for engine in engines:
+            await engine.quit()
+        exit(1)
+
+    print(f"Starting {num_engines} engine(s) from '{engine_path}' "
+          f"using {threads_per_engine} thread(s) and {hash_per_engine} MB hash size each.")
+    return engines
+
+
+def encode_move_tree(move_tree):
+    """
+    Converts a move tree to nested lists of UCI strings for JSON transport.
+    """
+    return [[move.uci(), encode_move_tree(variations)] for move, variations in move_tree]
+
+
+def decode_move_tree(encoded_tree):
+    """
+    Inverse of encode_move_tree.
+    """
+    return [(chess.Move.from_uci(uci), decode_move_tree(variations)) for uci, variations in encoded_tree]
+
+
+async def request_move_tree(socket_path, request):
+    """
+    Sends an analysis request to a running chess_daemon.py and returns the
+    move tree it generated.
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        # The daemon closes the connection after its single response
+        response = json.loads(await reader.read())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return decode_move_tree(response["move_tree"])
+
+
+def save_pgn(output_file, board, move_tree):
+    """
+    Writes the analysed game to output_file.
+    """
+    try:
+        with open(output_file, 'w', buffering=1 << 20) as pgn_file:
+            write_pgn(pgn_file, initialize_pgn_headers(), board, move_tree)
+        print(f"Analysis saved to '{output_file}'")
+    except IOError as e:
+        print(f"Failed to write PGN file: {e}")
+        exit(1)
+
+
+async def main():
     """
     Main function: orchestrates argument parsing, engine setup, move-tree generation, and PGN saving.
     """
     # Parse arguments
     args = parse_arguments()
 
-    # Determine engine path from argument or environment variable
-    engine_path = args.engine_path or os.getenv("ENGINE_PATH")
-    if not engine_path:
-        print("ERROR: No engine path provided (via --engine-path or ENGINE_PATH env).")
-        exit(1)
-
     # Read command-line args
-    moves = args.moves
     pgn_depth = args.pgn_depth
     engine_analysis_depth = args.engine_depth
     output_file = args.output
 
-    # Engine config
-    num_threads = args.threads
-    hash_size = args.hash_size
-
+    # Apply user-specified moves to reach desired starting position
     try:
-        engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-    except Exception as e:
-        print(f"Failed to start engine at {engine_path}: {e}")
+        board = board_from_moves(args.moves)
+    except ValueError as e:
+        print(e)
         exit(1)
 
-    engine.configure({
-        "Threads": num_threads,
-        "Hash": hash_size,
-    })
-
-    print(f"Starting engine from '{engine_path}' "
-          f"using {num_threads} thread(s) and {hash_size} MB hash size.")
+    if args.engine_daemon:
+        # Let the long-running daemon (with warm engines and cache) do the work
+        request = {
+            "moves": args.moves,
+            "pgn_depth": pgn_depth,
+            "engine_depth": engine_analysis_depth,
+            "book_path": os.path.abspath(args.book_path) if args.book_path else None,
+            "book_depth": args.book_depth,
+        }
+        try:
+            move_tree = await request_move_tree(args.daemon_socket, request)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Engine daemon request failed: {e}")
+            exit(1)
 
-    with engine:
-        board = chess.Board()
+        save_pgn(output_file, board, move_tree)
+        return
 
-        # Apply user-specified moves to reach desired starting position
-        for move_san in moves:
-            try:
-                move = board.parse_san(move_san)
-                board.push(move)
-            except ValueError as e:
-                print(f"Invalid move '{move_san}': {e}")
-                exit(1)
+    # Determine engine path from argument or environment variable
+    engine_path = args.engine_path or os.getenv("ENGINE_PATH")
+    if not engine_path:
+        print("ERROR: No engine path provided (via --engine-path or ENGINE_PATH env).")
+        exit(1)
 
-        game = initialize_pgn_headers()
-        node = game
+    # Open the opening book once for the whole run
+    book = None
+    if args.book_path:
+        try:
+            book = chess.polyglot.open_reader(args.book_path)
+        except OSError as e:
+            print(f"Failed to open opening book '{args.book_path}': {e}")
+            exit(1)
 
-        # Add the initial moves to the PGN
-        temp_board = chess.Board()
-        for move in board.move_stack:
-            node = node.add_main_variation(move)
-            temp_board.push(move)
+    engines = await start_engines(engine_path, args.engines, args.threads, args.hash_size)
 
+    try:
         # Estimate total moves for progress bar
         total_moves = estimate_total_moves(pgn_depth, board.turn)
-        progress_bar = tqdm(total=total_moves, desc="Analyzing", unit="move")
+        progress_bar = tqdm(total=total_moves, desc="Analyzing", unit="move", mininterval=1.0, disable=args.quiet)
+
+        # Reuse analyses from earlier runs with the same engine and depth
+        cache_path = analysis_cache_path(args.cache_dir, engine_path, engine_analysis_depth)
+        load_analysis_cache(cache_path)
 
         # Generate the move tree from the current position
-        move_tree = generate_move_tree(board, engine, pgn_depth, engine_analysis_depth, progress_bar)
+        try:
+            move_tree = await generate_move_tree(board, engines, pgn_depth, engine_analysis_depth, progress_bar,
+                                                 book=book, book_depth=args.book_depth)
+        except chess.engine.EngineError as e:
+            print(f"Engine error during analysis: {e}")
+            exit(1)
+        finally:
+            # Keep whatever was analysed, even if the run failed or was interrupted
+            save_analysis_cache(cache_path, engine_analysis_depth)
         progress_bar.close()
 
-        # Add moves to PGN
-        add_moves_to_pgn(node, move_tree)
-
         # Save PGN file
-        try:
-            with open(output_file, 'w') as pgn_file:
-                exporter = chess.pgn.FileExporter(pgn_file)
-                game.accept(exporter)
-            print(f"Analysis saved to '{output_file}'")
-        except IOError as e:
-            print(f"Failed to write PGN file: {e}")
-            exit(1)
+        save_pgn(output_file, board, move_tree)
+    finally:
+        for engine in engines:
+            await engine.quit()
+        if book is not None:
+            book.close()
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())